@@ -0,0 +1,62 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Optional C implementation of the chemical-formula subscripting in app_backend.
+
+Build in place with:  cythonize -i _format_ext.pyx
+app_backend falls back to its pure-Python scan when this module is not built.
+"""
+
+cdef extern from "Python.h":
+    object PyUnicode_New(Py_ssize_t size, Py_UCS4 maxchar)
+    int PyUnicode_KIND(object o)
+    void* PyUnicode_DATA(object o)
+    Py_UCS4 PyUnicode_MAX_CHAR_VALUE(object o)
+    Py_UCS4 PyUnicode_READ(int kind, void* data, Py_ssize_t index)
+    void PyUnicode_WRITE(int kind, void* data, Py_ssize_t index, Py_UCS4 value)
+
+cdef enum:
+    SUBSCRIPT_ZERO = 0x2080 # U+2080; the other subscript digits follow in order
+
+
+cpdef str subscript_chem(str text):
+    """
+    Subscripts ASCII digit runs that directly follow [A-Z][a-z]* (e.g. H2O -> H₂O).
+    Returns text itself when there is nothing to subscript.
+    """
+    cdef Py_ssize_t n = len(text)
+    cdef Py_ssize_t i
+    cdef int in_kind = PyUnicode_KIND(text)
+    cdef void* in_data = PyUnicode_DATA(text)
+    cdef unsigned int ch # Code point as a plain integer so it can be offset
+    cdef bint in_symbol = False # Inside an element symbol: an uppercase letter plus lowercase tail
+    cdef bint in_run = False # Inside a digit run that is being subscripted
+    cdef bint changed = False
+
+    # Output keeps the input length; it only needs to be wide enough for the subscript digits
+    cdef unsigned int maxchar = PyUnicode_MAX_CHAR_VALUE(text)
+    if maxchar < SUBSCRIPT_ZERO + 9:
+        maxchar = SUBSCRIPT_ZERO + 9
+    out = PyUnicode_New(n, maxchar)
+    cdef int out_kind = PyUnicode_KIND(out)
+    cdef void* out_data = PyUnicode_DATA(out)
+
+    for i in range(n):
+        ch = PyUnicode_READ(in_kind, in_data, i)
+        if 0x30 <= ch <= 0x39: # 0-9
+            if in_symbol or in_run:
+                ch = SUBSCRIPT_ZERO + (ch - 0x30)
+                in_run = True
+                changed = True
+            in_symbol = False
+        elif 0x41 <= ch <= 0x5A: # A-Z
+            in_symbol = True
+            in_run = False
+        elif 0x61 <= ch <= 0x7A: # a-z, only extends a symbol that is already open
+            in_run = False
+        else:
+            in_symbol = False
+            in_run = False
+        PyUnicode_WRITE(out_kind, out_data, i, ch)
+
+    # An unchanged copy would be wider than its contents need, so never hand it out
+    return out if changed else text
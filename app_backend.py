@@ -1,150 +1,616 @@
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import re
+import os
+import atexit
+import asyncio
+import hashlib
 import logging
-from typing import Dict, Any, Tuple, Optional
+import queue
+import threading
+from collections import OrderedDict
+from dataclasses import InitVar, dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import attrgetter
+from typing import Dict, Any, Callable, Iterator, List, Tuple, Optional
+
+import numpy as np
+
+try:
+    # Optional C build of _subscript_after_letters, see _format_ext.pyx
+    from _format_ext import subscript_chem as _subscript_chem_ext
+except ImportError:
+    _subscript_chem_ext = None
+
+try:
+    import orjson
+except ImportError: # Faster JSON is optional, the stdlib is used otherwise
+    orjson = None
 
 # Setup basic logging
 logger = logging.getLogger(__name__)
 
+@dataclass(frozen=True, slots=True)
+class Metrics:
+    """
+    Usage metrics of a single Gemini response. Frozen so it can be shared and hashed.
+    character_length is derived once from the response text, which is not kept.
+    """
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    character_length: int = field(init=False, default=0)
+    finish_reason: str = "N/A"
+    text: InitVar[str] = ""
+    
+    def __post_init__(self, text: str):
+        object.__setattr__(self, "character_length", len(text))
+
 # --- Model Configuration ---
 # FIXED: Using the model you requested
 MODEL_NAME = "gemini-2.5-flash-preview-09-2025"
 BASE_API_URL = "https://generativelanguage.googleapis.com/v1beta/models"
 
+# --- Formatting Patterns ---
+# Compiled once at import time instead of on every call
+_ASCII_DIGITS = "0123456789"
+_SUBSCRIPTS = str.maketrans(_ASCII_DIGITS, "₀₁₂₃₄₅₆₇₈₉")
+# Maps every ASCII digit to "0" so digit runs can be located with str.find
+_DIGIT_MASK = str.maketrans("123456789", "000000000")
+_CHEM_RE = re.compile(r"([A-Z][a-z]*)(\d+)")
+_EXP_RE = re.compile(r"(\w)\^(\-?[\d\.]+)")
+
+# --- HTTP Clients ---
+RETRY_TOTAL = 2
+RETRY_BACKOFF = 0.2 # Seconds, doubled on each further attempt
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Streaming session, reused across calls so the TLS connection is kept alive between comparisons
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    # generateContent is a POST, which urllib3 does not retry unless allowed explicitly
+    max_retries=Retry(total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF, status_forcelist=list(RETRY_STATUSES), allowed_methods=["POST"]),
+))
+
+# Async client for the blocking endpoint; HTTP/2 multiplexes the A/B calls over one connection.
+# It is only ever used from _LOOP, since its connections are bound to the loop that opened them.
+_ACLIENT = httpx.AsyncClient(http2=True, timeout=30.0, limits=httpx.Limits(max_keepalive_connections=4))
+
+# --- Concurrency ---
+# Shared pool for prefetching streams without spawning threads per comparison
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="gemini")
+# Long-lived event loop (started on first use) that the async API calls run on, so callers
+# such as Streamlit's script thread never need an event loop of their own
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+# --- Response Cache ---
+# Exact matches are looked up in a small LRU; near-identical user prompts are matched by
+# embedding similarity, but only against entries with the same system prompt so
+# the A/B comparison never serves one side's answer to the other.
+EXACT_CACHE_MAX_ENTRIES = 256
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_MAX_ENTRIES = 1000 # Per system prompt
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "llm_compare.jsonl")
+
+_CACHE_LOCK = threading.Lock()
+_EMBEDDER_LOCK = threading.Lock()
+# Keyed by a blake2b digest of the request inputs, least recently used first
+_EXACT_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# Keyed by model + system prompt -> list of (normalized user prompt embedding, response)
+_SEMANTIC_CACHE: Dict[str, List[Tuple[Any, Dict[str, Any]]]] = {}
+_cache_loaded = False
+_cache_dirty = False
+_embedder = None # SentenceTransformer instance, or False if it could not be loaded
+
+# --- Parse Memo ---
+# Cache hits hand back the same response dict, so its parsed text/metrics are kept by
+# identity. The dict itself is stored alongside to keep its id() from being reused.
+# Only complete responses are memoized, since only those are cached and seen again.
+PARSE_MEMO_MAX_ENTRIES = 256
+_PARSE_MEMO_LOCK = threading.Lock()
+_PARSE_MEMO: "OrderedDict[int, Tuple[Dict[str, Any], Tuple[str, Optional[Metrics]]]]" = OrderedDict()
+
+def _json_loads(data):
+    """
+    Parses JSON from str or bytes, using orjson when it is installed.
+    """
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def to_pretty_json(obj: Any) -> str:
+    """
+    Serializes obj as indented JSON for display, using orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+def _subscript_after_letters(text: str) -> str:
+    """
+    Subscripts digit runs that directly follow an element symbol (e.g. H2O -> H₂O).
+    Single pass equivalent of _CHEM_RE for ASCII text that jumps between digit
+    runs with str.find instead of calling a lambda per match.
+    """
+    mask = text.translate(_DIGIT_MASK)
+    find = mask.find
+    n = len(text)
+    out = []
+    append = out.append
+    start = 0
+    i = find("0")
+    while i != -1:
+        j = i + 1
+        while j < n and mask[j] == "0":
+            j += 1
+        # Walk back over the lowercase tail of the symbol to its capital letter
+        k = i - 1
+        while k >= 0 and "a" <= text[k] <= "z":
+            k -= 1
+        if k >= 0 and "A" <= text[k] <= "Z":
+            append(text[start:i])
+            append(text[i:j].translate(_SUBSCRIPTS))
+            start = j
+        i = find("0", j)
+    if not start:
+        return text # Nothing to subscript
+    append(text[start:])
+    return "".join(out)
+
+# Prefer the compiled scan when it has been built; both give identical output
+_subscript_chem = _subscript_chem_ext or _subscript_after_letters
+
 def auto_format_text(text: str) -> str:
     """
     Automatically find and format chemical formulas and simple math notations.
     """
     if not text:
         return ""
-    # Use str.maketrans for efficient subscripting
-    subscripts = str.maketrans("0123456789", "₀₁₂₃₄₅₆₇₈₉")
-    # Format chemical formulas like H2O
-    text = re.sub(r"([A-Z][a-z]*)(\d+)", lambda m: m.group(1) + m.group(2).translate(subscripts), text)
+    # Format chemical formulas like H2O (only ASCII digits get subscripted, so skip text without any)
+    if any(map(text.__contains__, _ASCII_DIGITS)):
+        if text.isascii():
+            text = _subscript_chem(text)
+        else:
+            # \d also matches non-ASCII digits, which the fast path does not handle
+            text = _CHEM_RE.sub(lambda m, _tr=_SUBSCRIPTS: m.group(1) + m.group(2).translate(_tr), text)
     # Format simple exponents like x^2
-    text = re.sub(r"(\w)\^(\-?[\d\.]+)", r"$\1^{\2}$", text)
+    if "^" in text:
+        text = _EXP_RE.sub(r"$\1^{\2}$", text)
     return text
 
-def _call_gemini_api(api_key: str, user_prompt: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+def _get_embedder():
+    """
+    Lazily loads the sentence embedding model. Returns None if it is unavailable.
+    """
+    global _embedder
+    with _EMBEDDER_LOCK:
+        if _embedder is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+                _embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
+            except Exception as e:
+                logger.warning(f"Semantic cache disabled, could not load embedding model: {e}")
+                _embedder = False
+    return _embedder or None
+
+def _load_cache():
+    """
+    Loads cache entries persisted by a previous run. Must hold _CACHE_LOCK.
+    """
+    global _cache_loaded
+    _cache_loaded = True
+    try:
+        with open(CACHE_PATH, encoding="utf-8") as f:
+            for line in f:
+                entry = _json_loads(line)
+                if entry.get("key"):
+                    _EXACT_CACHE[entry["key"]] = entry["response"]
+                if entry.get("embedding") is not None:
+                    _SEMANTIC_CACHE.setdefault(entry["bucket"], []).append(
+                        (np.asarray(entry["embedding"], dtype=np.float32), entry["response"])
+                    )
+        while len(_EXACT_CACHE) > EXACT_CACHE_MAX_ENTRIES:
+            _EXACT_CACHE.popitem(last=False)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Ignoring unreadable response cache {CACHE_PATH}: {e}")
+
+@atexit.register
+def _save_cache():
+    """
+    Persists the response cache on interpreter shutdown.
+    """
+    if not _cache_dirty:
+        return
+    with _CACHE_LOCK:
+        # One record per response; both tiers store the same dict, so merge them by identity
+        records = {}
+        for key, response in _EXACT_CACHE.items():
+            records[id(response)] = {"key": key, "bucket": None, "embedding": None, "response": response}
+        for bucket, entries in _SEMANTIC_CACHE.items():
+            for emb, response in entries:
+                record = records.setdefault(id(response), {"key": None, "response": response})
+                record["bucket"] = bucket
+                record["embedding"] = emb.tolist()
+        try:
+            os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+            with open(CACHE_PATH, "w", encoding="utf-8") as f:
+                for record in records.values():
+                    f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not persist response cache to {CACHE_PATH}: {e}")
+
+def _cache_lookup(user_prompt: str, system_prompt: Optional[str]) -> Tuple[Optional[Dict[str, Any]], str, Any]:
     """
-    Private function to send a request to the Gemini API.
+    Checks the exact-match tier, then the semantic tier.
     
-    Args:
-        api_key: The Google Gemini API key.
-        user_prompt: The user's input prompt.
-        system_prompt: The optional system-level instructions.
-        
     Returns:
-        A dictionary of the JSON response from the API.
+        The cached response (or None), the exact-match key and the prompt embedding
+        (or None) so that a miss can be stored without recomputing them.
     """
-    # Construct the correct URL for the specified model
-    gemini_api_url = f"{BASE_API_URL}/{MODEL_NAME}:generateContent?key={api_key}"
+    bucket = f"{MODEL_NAME}\n{system_prompt or ''}"
+    # Hashing once keeps the LRU from re-hashing long prompt strings on every lookup
+    key = hashlib.blake2b(
+        f"{MODEL_NAME}\x00{system_prompt or ''}\x00{user_prompt}".encode("utf-8"), digest_size=16
+    ).hexdigest()
     
-    headers = {"Content-Type": "application/json"}
+    with _CACHE_LOCK:
+        if not _cache_loaded:
+            _load_cache()
+        cached = _EXACT_CACHE.get(key)
+        if cached is not None:
+            _EXACT_CACHE.move_to_end(key)
+    if cached is not None:
+        logger.info("Response cache hit (exact)")
+        return cached, key, None
     
+    model = _get_embedder()
+    if model is None:
+        return None, key, None
+    
+    embedding = model.encode(user_prompt, normalize_embeddings=True)
+    with _CACHE_LOCK:
+        entries = list(_SEMANTIC_CACHE.get(bucket, ()))
+    if entries:
+        scores = np.stack([emb for emb, _ in entries]) @ embedding
+        best = int(scores.argmax())
+        if scores[best] >= SEMANTIC_CACHE_THRESHOLD:
+            logger.info(f"Response cache hit (semantic, similarity {scores[best]:.3f})")
+            return entries[best][1], key, embedding
+    return None, key, embedding
+
+def _is_complete_response(response_json: Dict[str, Any]) -> bool:
+    """
+    True if the response carries generated text and a finishReason. Blocked prompts
+    (promptFeedback only) and streams cut off before their final frame are not.
+    """
+    try:
+        candidate = response_json["candidates"][0]
+        return bool(candidate["content"]["parts"]) and bool(candidate.get("finishReason"))
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return False
+
+def _cache_store(key: str, system_prompt: Optional[str], embedding: Any, response_json: Dict[str, Any]):
+    """
+    Adds a successful API response to both cache tiers. Incomplete responses are skipped
+    so that they are not persisted and replayed.
+    """
+    global _cache_dirty
+    if not _is_complete_response(response_json):
+        logger.info("Not caching incomplete response")
+        return
+    bucket = f"{MODEL_NAME}\n{system_prompt or ''}"
+    with _CACHE_LOCK:
+        _EXACT_CACHE[key] = response_json
+        if len(_EXACT_CACHE) > EXACT_CACHE_MAX_ENTRIES:
+            _EXACT_CACHE.popitem(last=False)
+        if embedding is not None:
+            entries = _SEMANTIC_CACHE.setdefault(bucket, [])
+            entries.append((embedding, response_json))
+            del entries[:-SEMANTIC_CACHE_MAX_ENTRIES]
+        _cache_dirty = True
+
+_HEADERS = {"Content-Type": "application/json"}
+
+def _build_payload(user_prompt: str, system_prompt: Optional[str]) -> Dict[str, Any]:
+    """
+    Builds the request body shared by the blocking and streaming endpoints.
+    """
     payload = {
         "contents": [{"role": "user", "parts": [{"text": user_prompt}]}]
     }
     
     if system_prompt:
         payload["systemInstruction"] = {"parts": [{"text": system_prompt}]}
+    return payload
+
+def _run_async(coro) -> Any:
+    """
+    Runs a coroutine on the shared background event loop and waits for its result.
+    """
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="gemini-async", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result()
+
+async def _call_gemini_api(api_key: str, user_prompt: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Private coroutine to send a request to the Gemini API.
+    
+    Args:
+        api_key: The Google Gemini API key.
+        user_prompt: The user's input prompt.
+        system_prompt: The optional system-level instructions.
         
+    Returns:
+        A dictionary of the JSON response from the API.
+    """
+    # The lookup may compute an embedding, so keep it off the event loop
+    cached, cache_key, embedding = await asyncio.to_thread(_cache_lookup, user_prompt, system_prompt)
+    if cached is not None:
+        return cached
+    
+    # Construct the correct URL for the specified model
+    gemini_api_url = f"{BASE_API_URL}/{MODEL_NAME}:generateContent?key={api_key}"
+    payload = _build_payload(user_prompt, system_prompt)
+    
     logger.info(f"Calling Gemini API with system prompt: {bool(system_prompt)}")
     
     try:
-        response = requests.post(gemini_api_url, headers=headers, json=payload, timeout=30)
+        for attempt in range(RETRY_TOTAL + 1):
+            response = await _ACLIENT.post(gemini_api_url, headers=_HEADERS, json=payload)
+            # Same status-based retries as the streaming session's urllib3 Retry
+            if response.status_code not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+                break
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
         # Raise an HTTPError for bad responses (4xx or 5xx)
         response.raise_for_status()
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Network or API Error: {e}")
         return {"error": f"❌ Network or API Error: {e}"}
+    
+    response_json = _json_loads(response.content)
+    _cache_store(cache_key, system_prompt, embedding, response_json)
+    return response_json
+
+def _stream_gemini_api(api_key: str, user_prompt: str, system_prompt: Optional[str] = None,
+                       response_out: Optional[List[Dict[str, Any]]] = None) -> Iterator[str]:
+    """
+    Private generator that streams a response from the Gemini API as server-sent events.
+    
+    Args:
+        api_key: The Google Gemini API key.
+        user_prompt: The user's input prompt.
+        system_prompt: The optional system-level instructions.
+        response_out: Receives, once the stream is exhausted, the generateContent-shaped
+            response (full text plus the usage metadata of the final frame), or an error dict.
+            A cache hit appends the cached dict itself, so its memoized parse is reused.
         
-    return response.json()
+    Yields:
+        The response text, chunk by chunk as it is generated.
+    """
+    if response_out is None:
+        response_out = []
+    
+    cached, cache_key, embedding = _cache_lookup(user_prompt, system_prompt)
+    if cached is not None:
+        response_out.append(cached)
+        yield extract_text_and_metrics(cached)[0]
+        return
+    
+    gemini_api_url = f"{BASE_API_URL}/{MODEL_NAME}:streamGenerateContent?alt=sse&key={api_key}"
+    
+    logger.info(f"Streaming Gemini API with system prompt: {bool(system_prompt)}")
+    
+    parts = []
+    last_frame = {}
+    try:
+        with _SESSION.post(gemini_api_url, headers=_HEADERS, json=_build_payload(user_prompt, system_prompt),
+                           timeout=30, stream=True) as response:
+            response.raise_for_status()
+            # Raw bytes: without a charset requests would decode text/event-stream as ISO-8859-1,
+            # whereas SSE is always UTF-8, which _json_loads decodes itself
+            for line in response.iter_lines():
+                if not line or not line.startswith(b"data: "):
+                    continue # Blank keep-alive lines separate the SSE frames
+                last_frame = _json_loads(line[6:])
+                try:
+                    chunk = last_frame["candidates"][0]["content"]["parts"][0]["text"]
+                except (KeyError, IndexError, TypeError):
+                    continue # e.g. the terminal frame that only carries finishReason/usage
+                parts.append(chunk)
+                yield chunk
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Network or API Error: {e}")
+        error = f"❌ Network or API Error: {e}"
+        response_out.append({"error": error})
+        yield error
+        return
+    
+    # Reassemble the frames into the shape returned by generateContent
+    response_json = dict(last_frame)
+    candidate = dict((last_frame.get("candidates") or [{}])[0])
+    if parts:
+        candidate["content"] = {"role": "model", "parts": [{"text": "".join(parts)}]}
+    response_json["candidates"] = [candidate]
+    _cache_store(cache_key, system_prompt, embedding, response_json)
+    response_out.append(response_json)
+
+def _prefetch(stream: Iterator[str]) -> Iterator[str]:
+    """
+    Starts consuming a stream on the shared executor right away and relays its chunks,
+    so a stream that is rendered later is not waiting on the one rendered first.
+    """
+    chunks: "queue.Queue[Any]" = queue.Queue()
+    done = object()
+    
+    def _drain():
+        try:
+            for chunk in stream:
+                chunks.put(chunk)
+        except Exception as e:
+            logger.error(f"Error while prefetching stream: {e}")
+        finally:
+            chunks.put(done)
+    
+    def _relay():
+        while (chunk := chunks.get()) is not done:
+            yield chunk
+    
+    # Submitted here rather than inside a generator body, which would only run on first next()
+    _EXECUTOR.submit(_drain)
+    return _relay()
 
-def extract_text_and_metrics(response_json: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+def extract_text_and_metrics(response_json: Dict[str, Any]) -> Tuple[str, Optional[Metrics]]:
     """
     Extracts the generated text and usage metadata from a Gemini response.
+    Results are memoized per response object. Metrics is None for error responses.
     """
     if "error" in response_json:
-        return response_json["error"], {}
-        
+        return response_json["error"], None
+    
+    key = id(response_json)
+    with _PARSE_MEMO_LOCK:
+        hit = _PARSE_MEMO.get(key)
+        if hit is not None and hit[0] is response_json:
+            _PARSE_MEMO.move_to_end(key)
+            return hit[1]
+    
+    result = _parse_response(response_json)
+    if not _is_complete_response(response_json):
+        return result
+    with _PARSE_MEMO_LOCK:
+        _PARSE_MEMO[key] = (response_json, result)
+        if len(_PARSE_MEMO) > PARSE_MEMO_MAX_ENTRIES:
+            _PARSE_MEMO.popitem(last=False)
+    return result
+
+def _parse_response(response_json: Dict[str, Any]) -> Tuple[str, Optional[Metrics]]:
+    """
+    Walks a successful Gemini response. Called by extract_text_and_metrics on a memo miss.
+    """
+    # The first candidate is looked up once and shared by the text and finish reason
+    candidate = {}
     try:
         # Navigate the response structure safely
-        text = response_json["candidates"][0]["content"]["parts"][0]["text"]
+        candidate = (response_json.get("candidates") or ({},))[0]
+        text = response_text = candidate["content"]["parts"][0]["text"]
     except (KeyError, IndexError, TypeError):
         logger.warning(f"Could not parse text from response: {response_json}")
         text = "⚠️ Could not parse response text."
+        response_text = "" # The placeholder is not part of the response, so it has no length
         
     try:
-        usage = response_json.get("usageMetadata", {})
-        metrics = {
-            "prompt_tokens": usage.get("promptTokenCount", 0),
-            "completion_tokens": usage.get("candidatesTokenCount", 0),
-            "total_tokens": usage.get("totalTokenCount", 0),
-            "character_length": len(text),
-            "finish_reason": response_json.get("candidates", [{}])[0].get("finishReason", "N/A"),
-        }
+        usage_get = (response_json.get("usageMetadata") or {}).get
+        metrics = Metrics(
+            prompt_tokens=usage_get("promptTokenCount", 0),
+            completion_tokens=usage_get("candidatesTokenCount", 0),
+            total_tokens=usage_get("totalTokenCount", 0),
+            finish_reason=candidate.get("finishReason", "N/A"),
+            text=response_text,
+        )
     except Exception as e:
         logger.error(f"Error extracting metrics: {e}")
-        metrics = {}
+        metrics = None
         
     return text, metrics
 
-def calculate_insights(metrics_a: Dict, metrics_b: Dict) -> Optional[Dict]:
+def calculate_insights(metrics_a: Optional[Metrics], metrics_b: Optional[Metrics]) -> Optional[Dict]:
     """
     Analyzes the metrics and provides a dictionary of comparisons.
     This is pure calculation, no Streamlit code.
+    Results are memoized on the metric values; treat the returned dict as read-only.
     """
-    if not metrics_a or not metrics_b or metrics_b.get("total_tokens", 0) == 0:
+    if metrics_a is None or metrics_b is None or metrics_b.total_tokens == 0:
         return None # Not enough data to compare
+    
+    return _calculate_insights_cached(metrics_a, metrics_b)
+
+# The metrics compared by calculate_insights, in the order of its delta/percent arrays
+_INSIGHT_FIELDS = attrgetter("total_tokens", "character_length", "completion_tokens")
+
+# --- Insight Templates ---
+# Summary sentence per (length bucket, token bucket), formatted with lp/tp = length/token % change
+_LENGTH_SUMMARIES = {
+    "longer": "The system prompt produced a **significantly more detailed** response (+{lp:.1f}% longer).",
+    "shorter": "The system prompt resulted in a **more concise** response ({lp:.1f}% shorter).",
+    "similar": "The response lengths were **very similar**.",
+}
+_TOKEN_SUMMARIES = {
+    "more": "This came at a cost of **{tp:.1f}% more tokens**.",
+    "fewer": "This was achieved while being **more token-efficient** ({tp:.1f}% fewer tokens).",
+}
+_SUMMARY_TEMPLATES = {
+    (length, tokens): f"{length_text} {token_text}"
+    for length, length_text in _LENGTH_SUMMARIES.items()
+    for tokens, token_text in _TOKEN_SUMMARIES.items()
+}
 
+_VERDICT_BETTER = ("success", "**🏆 The System Prompt appears better.** It provided a more detailed answer without a disproportionate increase in cost.")
+_VERDICT_EXPENSIVE = ("warning", "**⚠️ The System Prompt is more expensive.** It used significantly more tokens for a modest increase in detail. Consider refining the system prompt.")
+_VERDICT_CONCISE = ("info", "**💡 The System Prompt is more concise.** This is ideal if your goal is brevity and lower cost.")
+_VERDICT_COMPARABLE = ("info", "**⚖️ The results are comparable.** The system prompt did not drastically change the output's size or cost.")
+# (verdict_type, verdict_text) per (length bucket, cost bucket)
+_VERDICT_TABLE = {
+    ("longer", "cheap"): _VERDICT_BETTER,
+    ("longer", "expensive"): _VERDICT_EXPENSIVE,
+    ("longer", "neutral"): _VERDICT_COMPARABLE,
+    ("shorter", "cheap"): _VERDICT_CONCISE,
+    ("shorter", "expensive"): _VERDICT_EXPENSIVE,
+    ("shorter", "neutral"): _VERDICT_CONCISE,
+    ("similar", "cheap"): _VERDICT_COMPARABLE,
+    ("similar", "expensive"): _VERDICT_EXPENSIVE,
+    ("similar", "neutral"): _VERDICT_COMPARABLE,
+}
+
+@lru_cache(maxsize=256)
+def _calculate_insights_cached(metrics_a: Metrics, metrics_b: Metrics) -> Optional[Dict]:
+    """
+    Memoized body of calculate_insights; Metrics is frozen and therefore hashable.
+    """
     try:
         insights = {}
         
+        # All deltas in one call; a zero baseline yields a 0% change instead of dividing by zero
+        base = np.array(_INSIGHT_FIELDS(metrics_a), dtype=np.float64)
+        deltas = np.array(_INSIGHT_FIELDS(metrics_b), dtype=np.float64) - base
+        percents = np.divide(deltas, base, out=np.zeros_like(base), where=base != 0) * 100
+        token_delta, len_delta, comp_token_delta = (int(d) for d in deltas)
+        token_percent_change, len_percent_change, comp_percent_change = percents.tolist()
+        
         # Total Tokens
-        token_delta = metrics_b["total_tokens"] - metrics_a["total_tokens"]
-        token_percent_change = (token_delta / metrics_a["total_tokens"]) * 100 if metrics_a["total_tokens"] else 0
         insights["token_metric"] = (f"{token_delta:+} tokens", f"{token_percent_change:.1f}%")
         
         # Character Length
-        len_delta = metrics_b["character_length"] - metrics_a["character_length"]
-        len_percent_change = (len_delta / metrics_a["character_length"]) * 100 if metrics_a["character_length"] else 0
         insights["length_metric"] = (f"{len_delta:+} chars", f"{len_percent_change:.1f}%")
         
         # Completion Tokens
-        comp_token_delta = metrics_b["completion_tokens"] - metrics_a["completion_tokens"]
-        comp_percent_change = (comp_token_delta / metrics_a["completion_tokens"]) * 100 if metrics_a["completion_tokens"] else 0
         insights["completion_metric"] = (f"{comp_token_delta:+} tokens", f"{comp_percent_change:.1f}%")
 
-        # --- Textual Summary ---
-        summary = []
-        if len_percent_change > 5:
-            summary.append(f"The system prompt produced a **significantly more detailed** response (+{len_percent_change:.1f}% longer).")
-        elif len_percent_change < -5:
-            summary.append(f"The system prompt resulted in a **more concise** response ({len_percent_change:.1f}% shorter).")
-        else:
-            summary.append("The response lengths were **very similar**.")
+        length_bucket = "longer" if len_percent_change > 5 else "shorter" if len_percent_change < -5 else "similar"
         
-        if token_percent_change > 0:
-            summary.append(f"This came at a cost of **{token_percent_change:.1f}% more tokens**.")
-        else:
-            summary.append(f"This was achieved while being **more token-efficient** ({token_percent_change:.1f}% fewer tokens).")
-        insights["summary"] = " ".join(summary)
+        # --- Textual Summary ---
+        token_bucket = "more" if token_percent_change > 0 else "fewer"
+        insights["summary"] = _SUMMARY_TEMPLATES[(length_bucket, token_bucket)].format(lp=len_percent_change, tp=token_percent_change)
         
         # --- Verdict ---
-        if len_percent_change > 5 and token_percent_change < 15:
-            insights["verdict_type"] = "success"
-            insights["verdict_text"] = "**🏆 The System Prompt appears better.** It provided a more detailed answer without a disproportionate increase in cost."
-        elif token_percent_change > 15 and len_percent_change < token_percent_change:
-            insights["verdict_type"] = "warning"
-            insights["verdict_text"] = "**⚠️ The System Prompt is more expensive.** It used significantly more tokens for a modest increase in detail. Consider refining the system prompt."
-        elif len_percent_change < -5:
-            insights["verdict_type"] = "info"
-            insights["verdict_text"] = "**💡 The System Prompt is more concise.** This is ideal if your goal is brevity and lower cost."
+        # "expensive": >15% more tokens without a matching gain in length
+        if token_percent_change > 15 and len_percent_change < token_percent_change:
+            cost_bucket = "expensive"
+        elif token_percent_change < 15:
+            cost_bucket = "cheap"
         else:
-            insights["verdict_type"] = "info"
-            insights["verdict_text"] = "**⚖️ The results are comparable.** The system prompt did not drastically change the output's size or cost."
+            cost_bucket = "neutral"
+        insights["verdict_type"], insights["verdict_text"] = _VERDICT_TABLE[(length_bucket, cost_bucket)]
             
         return insights
         
@@ -155,22 +621,58 @@ def calculate_insights(metrics_a: Dict, metrics_b: Dict) -> Optional[Dict]:
 # --- Main Orchestration Function ---
 def run_comparison(api_key: str, user_prompt: str, system_prompt: str) -> Dict[str, Any]:
     """
-    The main function called by the frontend.
+    Blocking comparison: returns once both responses are complete.
     Orchestrates the API calls and data extraction.
     """
+    return _run_async(_run_comparison_async(api_key, user_prompt, system_prompt))
+
+async def _run_comparison_async(api_key: str, user_prompt: str, system_prompt: str) -> Dict[str, Any]:
+    """
+    Issues the A/B API calls concurrently and assembles the comparison results.
+    """
+    if system_prompt:
+        # API Call A: User-Only, API Call B: System+User
+        # _call_gemini_api reports failures as an error dict, so gather() does not raise for API errors
+        response_a_json, response_b_json = await asyncio.gather(
+            _call_gemini_api(api_key, user_prompt),
+            _call_gemini_api(api_key, user_prompt, system_prompt),
+        )
+    else:
+        response_a_json = await _call_gemini_api(api_key, user_prompt)
+        response_b_json = None
+    
+    return _build_results(response_a_json, response_b_json)
+
+def stream_comparison(api_key: str, user_prompt: str, system_prompt: str) -> Tuple[Iterator[str], Optional[Iterator[str]], Callable[[], Dict[str, Any]]]:
+    """
+    Streaming counterpart of run_comparison for the frontend.
     
-    # API Call A: User-Only
-    response_a_json = _call_gemini_api(api_key, user_prompt)
+    Returns:
+        The text streams for A and B (None when there is no system prompt) and a function
+        that returns the same dictionary as run_comparison once both streams are consumed.
+    """
+    # Each stream appends its final response dict once it is exhausted
+    response_a_out: List[Dict[str, Any]] = []
+    response_b_out: List[Dict[str, Any]] = []
+    
+    # B starts streaming in the background while A is being rendered
+    stream_b = _prefetch(_stream_gemini_api(api_key, user_prompt, system_prompt, response_b_out)) if system_prompt else None
+    stream_a = _stream_gemini_api(api_key, user_prompt, None, response_a_out)
+    
+    return stream_a, stream_b, lambda: _build_results(response_a_out[0], response_b_out[0] if system_prompt else None)
+
+def _build_results(response_a_json: Dict[str, Any], response_b_json: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Extracts text and metrics from both responses and assembles the comparison results.
+    """
     response_a_text, metrics_a = extract_text_and_metrics(response_a_json)
     
-    # API Call B: System+User
-    if system_prompt:
-        response_b_json = _call_gemini_api(api_key, user_prompt, system_prompt)
+    if response_b_json is not None:
         response_b_text, metrics_b = extract_text_and_metrics(response_b_json)
     else:
         response_b_json = {}
         response_b_text = "⚠️ No system prompt provided."
-        metrics_b = {}
+        metrics_b = None
 
     # Calculate insights
     insights = calculate_insights(metrics_a, metrics_b)
@@ -1,9 +1,9 @@
+import html
 import streamlit as st
-import pandas as pd
 
 # Import the backend functions
 try:
-    from app_backend import run_comparison, auto_format_text, calculate_insights
+    from app_backend import stream_comparison, auto_format_text, calculate_insights, to_pretty_json
 except ImportError:
     st.error("FATAL: app_backend.py not found. Make sure it's in the same directory.")
     st.stop()
@@ -19,12 +19,37 @@ if 'run_comparison' not in st.session_state:
     st.session_state.run_comparison = False
 
 # --- API Key ---
+@st.cache_resource(show_spinner=False)
+def _get_api_key() -> str:
+    """ Reads the API key from st.secrets once per process instead of on every rerun. """
+    try:
+        return st.secrets["GEMINI_API_KEY"]
+    except KeyError as e:
+        # Raising keeps the failure out of the cache, so adding the secret later takes effect
+        raise RuntimeError("GEMINI_API_KEY missing from st.secrets") from e
+
 try:
-    GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
-except KeyError:
+    GEMINI_API_KEY = _get_api_key()
+except RuntimeError:
     st.error("Gemini API key not found. Please set `GEMINI_API_KEY` in st.secrets.")
     st.stop()
 
+# Row label -> Metrics attribute for the comparison table
+METRIC_ROWS = [
+    ("Prompt Tokens", "prompt_tokens"),
+    ("Completion Tokens", "completion_tokens"),
+    ("Total Tokens", "total_tokens"),
+    ("Finish Reason", "finish_reason"),
+    ("Character Length", "character_length"),
+]
+
+# Static HTML for the metrics table; st.markdown renders it with the theme's table styling
+METRICS_TABLE_TEMPLATE = (
+    "<table><thead><tr><th>Metric</th><th>A: User-Only</th><th>B: User+System</th></tr></thead>"
+    "<tbody>{rows}</tbody></table>"
+)
+METRICS_ROW_TEMPLATE = "<tr><th>{label}</th><td>{a}</td><td>{b}</td></tr>"
+
 # --- Helper Functions (Frontend) ---
 def clear_state_callback():
     """ Resets all relevant session state variables """
@@ -34,6 +59,18 @@ def clear_state_callback():
     st.session_state.user_prompt_input = "" 
     st.session_state.system_prompt_input = ""
 
+def render_metrics_table(metrics_a, metrics_b):
+    """ Renders the A/B metrics side by side as a static HTML table. """
+    rows = "".join(
+        METRICS_ROW_TEMPLATE.format(
+            label=label,
+            a=html.escape(str(getattr(metrics_a, attr, "-"))),
+            b=html.escape(str(getattr(metrics_b, attr, "-"))),
+        )
+        for label, attr in METRIC_ROWS
+    )
+    st.markdown(METRICS_TABLE_TEMPLATE.format(rows=rows), unsafe_allow_html=True)
+
 def render_response(text: str, label: str):
     """ Pre-formats the text and renders it. """
     st.markdown(f"**{label}**")
@@ -90,21 +127,34 @@ col2.button("Clear All", on_click=clear_state_callback)
 
 # --- Processing and Display Logic ---
 if st.session_state.run_comparison:
-    with st.spinner("Calling Gemini API..."):
-        try:
-            # Call the single backend function to get all results
-            st.session_state.comparison_results = run_comparison(
-                GEMINI_API_KEY, 
-                user_prompt, 
-                system_prompt
-            )
-        except Exception as e:
-            st.error(f"An unexpected error occurred in the backend: {e}")
-            st.session_state.comparison_results = None
-
-    # This ensures the spinner disappears and results are shown *after*
-    # the backend call is complete.
-    st.session_state.run_comparison = False 
+    st.session_state.run_comparison = False
+    st.session_state.comparison_results = None
+    try:
+        # Stream both responses as they are generated (B is fetched in the background meanwhile)
+        stream_a, stream_b, collect_results = stream_comparison(
+            GEMINI_API_KEY, 
+            user_prompt, 
+            system_prompt
+        )
+        st.subheader("📌 Generated Responses")
+        res_col1, res_col2 = st.columns(2)
+        with res_col1:
+            st.markdown("**A: Response (User Prompt Only)**")
+            st.write_stream(stream_a)
+        with res_col2:
+            st.markdown("**B: Response (With System Prompt)**")
+            if stream_b is not None:
+                st.write_stream(stream_b)
+            else:
+                st.markdown("⚠️ No system prompt provided.")
+        st.session_state.comparison_results = collect_results()
+    except Exception as e:
+        st.error(f"An unexpected error occurred in the backend: {e}")
+
+    # Rerun so the finished results are rendered (formatted) by the display logic below
+    # instead of alongside the raw streamed text.
+    if st.session_state.comparison_results:
+        st.rerun()
 
 # Display results *if* they exist in the session state
 if st.session_state.comparison_results:
@@ -124,32 +174,19 @@ if st.session_state.comparison_results:
     metrics_b = results["metrics_b"]
     
     if metrics_a:
-        data = {
-            "Metric": ["Prompt Tokens", "Completion Tokens", "Total Tokens", "Finish Reason", "Character Length"],
-            "A: User-Only": [
-                metrics_a.get("prompt_tokens", "-"),
-                metrics_a.get("completion_tokens", "-"),
-                metrics_a.get("total_tokens", "-"),
-                metrics_a.get("finish_reason", "-"),
-                metrics_a.get("character_length", "-"),
-            ],
-            "B: User+System": [
-                metrics_b.get("prompt_tokens", "-"),
-                metrics_b.get("completion_tokens", "-"),
-                metrics_b.get("total_tokens", "-"),
-                metrics_b.get("finish_reason", "-"),
-                metrics_b.get("character_length", "-"),
-            ],
-        }
-        df = pd.DataFrame(data).set_index("Metric")
-        st.table(df)
+        render_metrics_table(metrics_a, metrics_b)
 
     # --- Display Insights ---
     render_insights_from_dict(results["insights"])
 
     # --- Display Raw JSON ---
-    with st.expander("Show Raw API Responses for Debugging"):
-        st.json({
-            "Response A (User Only)": results["json_a"],
-            "Response B (User+System)": results["json_b"]
-        })
\ No newline at end of file
+    with st.expander("Show Raw API Responses for Debugging", expanded=False):
+        # Expander bodies run on every rerun even when collapsed, so only serialize on request
+        if st.toggle("Load raw JSON", key="show_debug"):
+            if "raw_json_text" not in results:
+                # Pre-serialized text skips Streamlit's interactive JSON tree widget
+                results["raw_json_text"] = to_pretty_json({
+                    "Response A (User Only)": results["json_a"],
+                    "Response B (User+System)": results["json_b"]
+                })
+            st.code(results["raw_json_text"], language="json")
\ No newline at end of file